@@ -1,72 +1,141 @@
 """State container delegating rule logic to rules module."""
 
+from __future__ import annotations
+
+import copy
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import TYPE_CHECKING, FrozenSet, List, Optional, Tuple
 
 from . import rules
-import chess
+
+if TYPE_CHECKING:
+    import chess
+
+# a state's (list, set) legal-move memos, saved so undo can restore them
+_Memos = Tuple[
+    Optional[Tuple[int, Tuple[rules.Move, ...]]],
+    Optional[Tuple[int, FrozenSet[rules.Move]]],
+]
 
 
 @dataclass
 class Board:
     state: rules.State
-    history: List[rules.State] = field(default_factory=list)
-
-    def __init__(self, fen: Optional[str] = None) -> None:
+    # (move, undo record, memos of the position before it) per move played
+    history: List[Tuple[rules.Move, rules.UndoInfo, _Memos]] = field(default_factory=list)
+    # Zobrist keys of the positions before each move, in play order
+    _hash_history: List[int] = field(default_factory=list, repr=False)
+    # memoize legal moves per position; perft-style callers may opt out
+    enable_move_cache: bool = True
+
+    def __init__(self, fen: Optional[str] = None, enable_move_cache: bool = True) -> None:
         self.state = rules.State.from_fen(
             fen or "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
         )
         self.history = []
+        self._hash_history = []
+        self.enable_move_cache = enable_move_cache
+
+    def __deepcopy__(self, memo: dict) -> 'Board':
+        # undo records and memoized move lists are never mutated, so only
+        # the state and the two stacks need fresh copies
+        board = copy.copy(self)
+        board.state = self.state.clone()
+        board.history = self.history[:]
+        board._hash_history = self._hash_history[:]
+        return board
 
     def make_move(self, move: rules.Move) -> None:
-        if move not in rules.generate_legal_moves(self.state):
+        # moves usually come from get_legal_moves, whose moves are still
+        # memoized; the memo is a tuple, so callers cannot tamper with it
+        state = self.state
+        legal = rules.cached_legal_moves(state)
+        if legal is not None:
+            valid = move in legal
+        else:
+            valid = rules.is_legal(state, move)
+        if not valid:
             raise ValueError("Illegal move")
-        self.history.append(self.state.clone())
-        rules.apply_move(self.state, move)
+        memos = (state._legal_cache, state._legal_set_cache)
+        self._hash_history.append(state.key)
+        self.history.append((move, rules.apply_move_inplace(state, move), memos))
 
     def undo_move(self) -> None:
         if not self.history:
             raise ValueError("No move to undo")
-        self.state = self.history.pop()
+        move, undo, memos = self.history.pop()
+        state = self.state
+        rules.undo_move_inplace(state, move, undo)
+        state._legal_cache, state._legal_set_cache = memos
+        self._hash_history.pop()
 
     def get_legal_moves(self) -> List[rules.Move]:
-        return rules.generate_legal_moves(self.state)
+        return rules.generate_legal_moves(self.state, self.enable_move_cache)
+
+    def get_legal_moves_set(self) -> FrozenSet[rules.Move]:
+        return rules.legal_move_set(self.state, self.enable_move_cache)
 
     def is_checkmate(self) -> bool:
-        return rules.is_checkmate(self.state)
+        return rules.is_checkmate(self.state, self.enable_move_cache)
 
     def is_stalemate(self) -> bool:
-        return rules.is_stalemate(self.state)
+        return rules.is_stalemate(self.state, self.enable_move_cache)
+
+    @property
+    def halfmove_clock(self) -> int:
+        """Plies since the last capture or pawn move, for cheap draw checks."""
+        return self.state.halfmove_clock
 
     def is_draw_by_fifty_moves(self) -> bool:
-        return rules.is_draw_by_fifty_moves(self.state)
+        return self.state.halfmove_clock >= 100
 
     def is_insufficient_material(self) -> bool:
         return rules.is_insufficient_material(self.state)
 
+    def is_repetition(self, count: int = 3) -> bool:
+        """Return whether the current position has occurred ``count`` times."""
+        if count <= 1:
+            return True  # the current position has occurred once already
+        key = self.state.key
+        hashes = self._hash_history
+        # nothing before the last capture or pawn move can recur, and only
+        # every other position has the same side to move
+        stop = len(hashes) - min(self.state.halfmove_clock, len(hashes)) - 1
+        seen = 1
+        for i in range(len(hashes) - 2, stop, -2):
+            if hashes[i] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    def is_draw_by_repetition(self) -> bool:
+        return self.is_repetition()
+
 
 @dataclass
 class ChessBoard:
     """Wrapper around python-chess Board with undo functionality."""
 
     board: chess.Board
-    history: List[str]
 
     def __init__(self, fen: str | None = None) -> None:
+        # python-chess is only needed here; importing it lazily keeps it off
+        # the import path of the custom engine
+        import chess
+
         self.board = chess.Board(fen) if fen else chess.Board()
-        self.history = []
 
     def make_move(self, move: chess.Move) -> None:
         if move not in self.board.legal_moves:
             raise ValueError("Illegal move")
-        self.history.append(self.board.fen())
         self.board.push(move)
 
     def undo_move(self) -> None:
-        if not self.history:
+        # python-chess keeps its own move stack with O(1) restore
+        if not self.board.move_stack:
             raise ValueError("No move to undo")
-        fen = self.history.pop()
-        self.board.set_fen(fen)
+        self.board.pop()
 
     def get_legal_moves(self) -> List[chess.Move]:
         return list(self.board.legal_moves)
@@ -1,10 +1,62 @@
 """Custom move generation and rule enforcement logic."""
 
-from dataclasses import dataclass
-from typing import List, Optional, Set
+import random
+from array import array
+from dataclasses import dataclass, field
+from typing import (
+    Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple,
+    Union,
+)
 
 FILES = 'abcdefgh'
 RANKS = '12345678'
+PIECES = 'PNBRQKpnbrqk'
+
+# piece codes: the low three bits give the type, BLACK_BIT marks black pieces
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+BLACK_BIT = 8
+# side colours; a piece code is ``kind | color << 3``
+WHITE, BLACK = 0, 1
+WP, WN, WB, WR, WQ, WK = range(1, 7)
+BP, BN, BB, BR, BQ, BK = range(9, 15)
+PIECE_CODES = {
+    'P': WP, 'N': WN, 'B': WB, 'R': WR, 'Q': WQ, 'K': WK,
+    'p': BP, 'n': BN, 'b': BB, 'r': BR, 'q': BQ, 'k': BK,
+}
+SYMBOLS = (None, 'P', 'N', 'B', 'R', 'Q', 'K', None, None, 'p', 'n', 'b', 'r', 'q', 'k')
+
+# FEN board parsing: digits expand to runs of '.', then every byte maps to
+# its piece code in one bytes.translate pass (-1 marks an invalid byte)
+_FEN_DIGITS = str.maketrans({str(n): '.' * n for n in range(1, 9)})
+_FEN_CODES = bytearray(b'\xff' * 256)
+_FEN_CODES[ord('.')] = EMPTY
+for _symbol, _code in PIECE_CODES.items():
+    _FEN_CODES[ord(_symbol)] = _code
+_FEN_CODES = bytes(_FEN_CODES)
+# per piece code, maps that code's byte to b'1' and every other byte to b'0';
+# the reversed result read in base 2 is the piece's bitboard
+_CODE_BITS = {
+    code: bytes(ord('1') if b == code else ord('0') for b in range(256))
+    for code in PIECE_CODES.values()
+}
+
+# castling rights bits
+CR_WK = 1
+CR_WQ = 2
+CR_BK = 4
+CR_BQ = 8
+CASTLING_BITS = {'K': CR_WK, 'Q': CR_WQ, 'k': CR_BK, 'q': CR_BQ}
+# rights kept when a move leaves or lands on a square: anything touching a
+# king or rook home square drops the rights that depend on it
+CASTLE_MASK = [CR_WK | CR_WQ | CR_BK | CR_BQ] * 64
+CASTLE_MASK[0] &= ~CR_BQ                # a8
+CASTLE_MASK[4] &= ~(CR_BK | CR_BQ)      # e8
+CASTLE_MASK[7] &= ~CR_BK                # h8
+CASTLE_MASK[56] &= ~CR_WQ               # a1
+CASTLE_MASK[60] &= ~(CR_WK | CR_WQ)     # e1
+CASTLE_MASK[63] &= ~CR_WK               # h1
+CASTLE_MASK = tuple(CASTLE_MASK)
 
 # movement offsets
 KNIGHT_OFFSETS = [
@@ -20,385 +72,1171 @@ KING_OFFSETS = [
 ]
 
 
+def _leaper_attacks(offsets: Iterable[Tuple[int, int]]) -> Tuple[int, ...]:
+    """Build a per-square attack bitboard table for a fixed-offset piece."""
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                mask |= 1 << (r * 8 + c)
+        table.append(mask)
+    return tuple(table)
+
+
+LIGHT_SQUARES = sum(1 << sq for sq in range(64) if (sq // 8 + sq % 8) % 2 == 0)  # a8 is light
+KNIGHT_ATTACKS = _leaper_attacks(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper_attacks(KING_OFFSETS)
+# squares attacked by a pawn of the given colour standing on each square
+PAWN_ATTACKS_W = _leaper_attacks([(-1, -1), (-1, 1)])
+PAWN_ATTACKS_B = _leaper_attacks([(1, -1), (1, 1)])
+# indexed by colour
+PAWN_ATTACKS = (PAWN_ATTACKS_W, PAWN_ATTACKS_B)
+
+# file masks for shifting whole sets without wrapping between a and h
+BB_ALL = (1 << 64) - 1
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+NOT_A = BB_ALL ^ FILE_A
+NOT_H = BB_ALL ^ FILE_H
+NOT_AB = NOT_A & ~(FILE_A << 1)
+NOT_GH = NOT_H & ~(FILE_H >> 1)
+
+
+def pawn_attack_set(pawns: int, color: int) -> int:
+    """Squares attacked by all of ``color``'s ``pawns`` at once."""
+    if color == WHITE:  # towards rank 8, i.e. lower indices
+        return (pawns & NOT_A) >> 9 | (pawns & NOT_H) >> 7
+    return ((pawns & NOT_A) << 7 | (pawns & NOT_H) << 9) & BB_ALL
+
+
+# ranks by board row: rank 8 is row 0
+RANK_8 = 0xFF
+RANK_6 = RANK_8 << 16
+RANK_3 = RANK_8 << 40
+RANK_1 = RANK_8 << 56
+
+
+# Pawn targets specialised per side: each returns (targets, from - to) for
+# single pushes, double pushes and the two capture directions, computed
+# for every pawn at once with that side's shifts and ranks written in.
+def _white_pawn_targets(pawns: int, empty: int, capturable: int) -> Tuple[Tuple[int, int], ...]:
+    push = pawns >> 8 & empty
+    return (
+        (push, 8),
+        ((push & RANK_3) >> 8 & empty, 16),
+        ((pawns & NOT_A) >> 9 & capturable, 9),
+        ((pawns & NOT_H) >> 7 & capturable, 7),
+    )
+
+
+def _black_pawn_targets(pawns: int, empty: int, capturable: int) -> Tuple[Tuple[int, int], ...]:
+    push = pawns << 8 & empty
+    return (
+        (push, -8),
+        ((push & RANK_6) << 8 & empty, -16),
+        ((pawns & NOT_A) << 7 & capturable, -7),
+        ((pawns & NOT_H) << 9 & capturable, -9),
+    )
+
+
+# signature shared by _white_pawn_targets and _black_pawn_targets
+_PawnTargets = Callable[[int, int, int], Tuple[Tuple[int, int], ...]]
+
+
+def knight_attack_set(knights: int) -> int:
+    """Squares attacked by all ``knights`` at once."""
+    a, h = knights & NOT_A, knights & NOT_H
+    ab, gh = knights & NOT_AB, knights & NOT_GH
+    return (
+        a >> 17 | h >> 15 | ab >> 10 | gh >> 6
+        | (ab << 6 | gh << 10 | a << 15 | h << 17) & BB_ALL
+    )
+
+
+def _rays(dr: int, dc: int) -> Tuple[int, ...]:
+    """Squares reached from each square stepping by (dr, dc) to the edge."""
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << (r * 8 + c)
+            r += dr
+            c += dc
+        table.append(mask)
+    return tuple(table)
+
+
+RAYS = {offset: _rays(*offset) for offset in BISHOP_OFFSETS + ROOK_OFFSETS}
+
+
+def ray_attacks(sq: int, occ: int, offset: Tuple[int, int]) -> int:
+    """Attacks along one ray: the ray cut off behind its first blocker."""
+    rays = RAYS[offset]
+    ray = rays[sq]
+    blockers = ray & occ
+    if not blockers:
+        return ray
+    if offset[0] * 8 + offset[1] > 0:  # ray runs towards higher indices
+        first = (blockers & -blockers).bit_length() - 1
+    else:
+        first = blockers.bit_length() - 1
+    return ray ^ rays[first]
+
+
+def _slider_tables(
+    offsets: Iterable[Tuple[int, int]]
+) -> Tuple[Tuple[int, ...], Tuple[Dict[int, int], ...]]:
+    """Build relevance masks and occupancy-indexed attack tables for a slider.
+
+    The mask of a square holds every ray square except the last one on each
+    ray, since a blocker there never changes the attack set. Each table maps
+    ``occ & mask`` to the attacked squares for every subset of the mask.
+    """
+    directions = [(RAYS[(dr, dc)], dr * 8 + dc > 0) for dr, dc in offsets]
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = 0
+        sq_rays = []
+        for rays, ascending in directions:
+            ray = rays[sq]
+            if ray:
+                edge = 1 << (ray.bit_length() - 1) if ascending else ray & -ray
+                mask |= ray ^ edge
+                sq_rays.append((ray, rays, ascending))
+        table = {}
+        sub = 0
+        while True:
+            attacks = 0
+            # same first-blocker cut as ray_attacks, inlined for import speed
+            for ray, rays, ascending in sq_rays:
+                blockers = ray & sub
+                if not blockers:
+                    attacks |= ray
+                elif ascending:
+                    attacks |= ray ^ rays[(blockers & -blockers).bit_length() - 1]
+                else:
+                    attacks |= ray ^ rays[blockers.bit_length() - 1]
+            table[sub] = attacks
+            sub = (sub - mask) & mask
+            if not sub:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return tuple(masks), tuple(tables)
+
+
+BISHOP_MASK, BISHOP_ATTACKS = _slider_tables(BISHOP_OFFSETS)
+ROOK_MASK, ROOK_ATTACKS = _slider_tables(ROOK_OFFSETS)
+
+
+def _line_tables() -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[Tuple[int, ...], ...]]:
+    """Build BETWEEN and LINE tables for every pair of aligned squares.
+
+    ``BETWEEN[a][b]`` holds the squares strictly between ``a`` and ``b``;
+    ``LINE[a][b]`` the whole rank, file or diagonal through both. Both are
+    0 when the squares do not share a line.
+    """
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for (dr, dc), rays in RAYS.items():
+        back = RAYS[(-dr, -dc)]
+        for sq in range(64):
+            full = rays[sq] | back[sq] | 1 << sq
+            rest = rays[sq]
+            while rest:
+                lsb = rest & -rest
+                rest ^= lsb
+                target = lsb.bit_length() - 1
+                between[sq][target] = rays[sq] & back[target]
+                line[sq][target] = full
+    return tuple(map(tuple, between)), tuple(map(tuple, line))
+
+
+BETWEEN, LINE = _line_tables()
+# stands in for LINE[king] where no piece can be pinned
+_NO_PIN_LINE = (BB_ALL,) * 64
+
+
+def _castle_path(right: int, king: int, king_to: int, rook: int) -> Tuple[int, int, int, int, int]:
+    """``(right, king_to, rook, empty mask, safe mask)`` for one castling side."""
+    safe = 1 << king | BETWEEN[king][king_to] | 1 << king_to
+    return right, king_to, rook, BETWEEN[king][rook], safe
+
+
+# per side to move: king home square and its two castling paths
+CASTLE_PATHS = (
+    (60, (_castle_path(CR_WK, 60, 62, 63), _castle_path(CR_WQ, 60, 58, 56))),
+    (4, (_castle_path(CR_BK, 4, 6, 7), _castle_path(CR_BQ, 4, 2, 0))),
+)
+
+
+def bishop_attacks(sq: int, occ: int) -> int:
+    return BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]]
+
+
+def rook_attacks(sq: int, occ: int) -> int:
+    return ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]]
+
+
+def queen_attacks(sq: int, occ: int) -> int:
+    return (
+        BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]]
+        | ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]]
+    )
+
+
+_zobrist_rng = random.Random(0xC0FFEE)
+ZOBRIST_PIECE: List[Tuple[int, ...]] = [()] * 15  # indexed by piece code
+for _symbol in PIECES:
+    ZOBRIST_PIECE[PIECE_CODES[_symbol]] = tuple(_zobrist_rng.getrandbits(64) for _ in range(64))
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)  # black to move
+ZOBRIST_CASTLE = tuple(_zobrist_rng.getrandbits(64) for _ in range(16))
+ZOBRIST_EP = tuple(_zobrist_rng.getrandbits(64) for _ in range(8))  # by file
+
+
+SQUARE_NAMES = tuple(f + r for r in reversed(RANKS) for f in FILES)  # by board index
+SQUARE_INDEX = {name: idx for idx, name in enumerate(SQUARE_NAMES)}
+
+
 def square_index(s: str) -> int:
     """Convert algebraic square (e.g. 'e4') to 0-63 index."""
-    file = FILES.index(s[0])
-    rank = 8 - int(s[1])
-    return rank * 8 + file
+    try:
+        return SQUARE_INDEX[s]
+    except KeyError:
+        raise ValueError(f"Invalid square: {s!r}") from None
 
 
 def index_to_square(idx: int) -> str:
-    return FILES[idx % 8] + RANKS[7 - idx // 8]
+    return SQUARE_NAMES[idx]
+
 
+class Move(int):
+    """A move packed into an int: ``from | to << 6 | promotion kind << 12``.
 
-@dataclass(frozen=True)
-class Move:
-    from_sq: int
-    to_sq: int
-    promotion: Optional[str] = None
+    Equality, hashing and list membership are plain int operations; the
+    properties are for callers, the engine itself decodes with bit ops.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, from_sq: int, to_sq: int, promotion: Optional[str] = None) -> 'Move':
+        if not (0 <= from_sq < 64 and 0 <= to_sq < 64):
+            raise ValueError(f"Square out of range: {from_sq}, {to_sq}")
+        code = from_sq | to_sq << 6
+        if promotion:
+            kind = PIECE_CODES.get(promotion.lower())
+            if kind is None:
+                raise ValueError(f"Invalid promotion piece: {promotion!r}")
+            code |= (kind & 7) << 12
+        return int.__new__(cls, code)
+
+    @property
+    def from_sq(self) -> int:
+        return self & 63
+
+    @property
+    def to_sq(self) -> int:
+        return self >> 6 & 63
+
+    @property
+    def promotion(self) -> Optional[str]:
+        kind = self >> 12
+        return SYMBOLS[kind | BLACK_BIT] if kind else None
+
+    def __repr__(self) -> str:
+        return f"Move.from_uci({self.to_uci()!r})"
+
+    def __reduce__(self) -> Tuple[type, Tuple[int, int, Optional[str]]]:
+        # int's default would call Move(code) with a single argument
+        return Move, (self & 63, self >> 6 & 63, self.promotion)
 
     @staticmethod
     def from_uci(uci: str) -> 'Move':
-        promo = uci[4] if len(uci) > 4 else None
-        return Move(square_index(uci[:2]), square_index(uci[2:4]), promo)
+        move = _UCI_MOVES.get(uci)
+        if move is None:
+            promo = uci[4] if len(uci) > 4 else None
+            move = Move(square_index(uci[:2]), square_index(uci[2:4]), promo)
+        return move
 
     def to_uci(self) -> str:
         base = index_to_square(self.from_sq) + index_to_square(self.to_sq)
         return base + (self.promotion or '')
 
 
-@dataclass
+# Every (from, to) pair and promotion set interned once, so the generators
+# only index and append instead of building a tuple per move.
+MOVE_TABLE = tuple(tuple(Move(frm, to) for to in range(64)) for frm in range(64))
+PROMOTION_MOVES = tuple(
+    tuple(tuple(Move(frm, to, p) for p in 'qrbn') for to in range(64))
+    for frm in range(64)
+)
+
+# UCI string -> interned move, for every square pair and for promotions onto
+# the back ranks; anything else is parsed by Move.from_uci
+_UCI_MOVES = {
+    SQUARE_NAMES[frm] + SQUARE_NAMES[to]: MOVE_TABLE[frm][to]
+    for frm in range(64) for to in range(64)
+}
+_UCI_MOVES.update(
+    (mv.to_uci(), mv)
+    for frm in range(64) for to in (*range(8), *range(56, 64))
+    for mv in PROMOTION_MOVES[frm][to]
+)
+
+# en passant square created by each (from | to << 6) pawn move, else None
+EP_TARGET: Tuple[Optional[int], ...] = tuple(
+    (frm + to) // 2 if frm // 8 in (1, 6) and abs(to - frm) == 16 else None
+    for to in range(64) for frm in range(64)
+)
+
+
+class Mailbox:
+    """Piece-symbol view of a state's squares (``'P'``..``'k'`` or None).
+
+    Reads, slices and comparisons behave like the 64-entry list the state
+    used to hold; writes are translated to piece codes and mirrored into
+    the bitboards.
+    """
+
+    __slots__ = ('_state',)
+
+    def __init__(self, state: 'State') -> None:
+        self._state = state
+
+    def __getitem__(self, sq: Union[int, slice]) -> Union[Optional[str], List[Optional[str]]]:
+        if isinstance(sq, slice):
+            return [SYMBOLS[code] for code in self._state.squares[sq]]
+        return SYMBOLS[self._state.squares[sq]]
+
+    def __setitem__(self, sq: int, piece: Optional[str]) -> None:
+        state = self._state
+        # a pawn appearing or vanishing can change whether en passant is hashed
+        state.key ^= _ep_key(state)
+        _set_square(state, sq, PIECE_CODES[piece] if piece else EMPTY)
+        state.key ^= _ep_key(state)
+
+    def __len__(self) -> int:
+        return 64
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return (SYMBOLS[code] for code in self._state.squares)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (Mailbox, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]  # mutable, like a list
+
+
+@dataclass(slots=True, init=False)
 class State:
-    board: List[Optional[str]]  # 64 entries
-    to_move: str               # 'w' or 'b'
-    castling_rights: Set[str]
-    en_passant: Optional[int]
+    squares: array             # 64 piece codes, typecode 'b'
+    # the hashed fields sit behind properties that keep ``key`` in step;
+    # apply/undo write them directly and update the key themselves, and
+    # __init__ takes them under their public names
+    _to_move: int              # WHITE or BLACK
+    _castling_rights: int      # CR_* bits
+    _en_passant: Optional[int]
     halfmove_clock: int
     fullmove_number: int
-    history: List['State']
+    # indexed by piece code; bit i of a bitboard is board index i
+    bb: List[int]
+    occ_w: int
+    occ_b: int
+    occ: int
+    key: int  # Zobrist hash, maintained incrementally
+    # (key, legal moves) of the last position moves were generated for
+    _legal_cache: Optional[Tuple[int, Tuple[Move, ...]]] = field(repr=False, compare=False)
+    # (key, frozenset of the same moves), built on first membership query
+    _legal_set_cache: Optional[Tuple[int, FrozenSet[Move]]] = field(repr=False, compare=False)
+    board: Mailbox = field(repr=False, compare=False)
+
+    @property
+    def to_move(self) -> int:
+        return self._to_move
+
+    @to_move.setter
+    def to_move(self, color: int) -> None:
+        key = self.key ^ _ep_key(self)
+        if color != self._to_move:
+            key ^= ZOBRIST_SIDE
+        self._to_move = color
+        self.key = key ^ _ep_key(self)
+
+    @property
+    def castling_rights(self) -> int:
+        return self._castling_rights
+
+    @castling_rights.setter
+    def castling_rights(self, rights: int) -> None:
+        self.key ^= ZOBRIST_CASTLE[self._castling_rights] ^ ZOBRIST_CASTLE[rights]
+        self._castling_rights = rights
+
+    @property
+    def en_passant(self) -> Optional[int]:
+        return self._en_passant
+
+    @en_passant.setter
+    def en_passant(self, sq: Optional[int]) -> None:
+        key = self.key ^ _ep_key(self)
+        self._en_passant = sq
+        self.key = key ^ _ep_key(self)
+
+    def __init__(
+        self,
+        squares: array,
+        to_move: int,
+        castling_rights: int,
+        en_passant: Optional[int],
+        halfmove_clock: int,
+        fullmove_number: int,
+        bb: Optional[List[int]] = None,
+        occ_w: int = 0,
+        occ_b: int = 0,
+        occ: int = 0,
+        key: int = 0,
+    ) -> None:
+        self.squares = squares
+        self._to_move = to_move
+        self._castling_rights = castling_rights
+        self._en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self._legal_cache = None
+        self._legal_set_cache = None
+        self.board = Mailbox(self)
+        if bb:
+            self.bb = bb
+            self.occ_w, self.occ_b, self.occ, self.key = occ_w, occ_b, occ, key
+            return
+        codes = self.squares.tobytes()
+        self.bb = bb = [0] * 15
+        for code, bits in _CODE_BITS.items():
+            if code in codes:
+                bb[code] = int(codes.translate(bits)[::-1], 2)
+        self.occ_w = bb[WP] | bb[WN] | bb[WB] | bb[WR] | bb[WQ] | bb[WK]
+        self.occ_b = bb[BP] | bb[BN] | bb[BB] | bb[BR] | bb[BQ] | bb[BK]
+        self.occ = self.occ_w | self.occ_b
+        self.key = zobrist_key(self)
 
     @staticmethod
     def from_fen(fen: str) -> 'State':
         parts = fen.split()
         board_part, active, castling, ep, halfmove, fullmove = parts
-        board: List[Optional[str]] = []
-        for row in board_part.split('/'):
-            for ch in row:
-                if ch.isdigit():
-                    board.extend([None] * int(ch))
-                else:
-                    board.append(ch)
-        rights = set(castling) if castling != '-' else set()
+        placement = board_part.replace('/', '').translate(_FEN_DIGITS)
+        codes = placement.encode('ascii').translate(_FEN_CODES)
+        if len(codes) != 64 or b'\xff' in codes:
+            raise ValueError(f"Invalid FEN board: {board_part!r}")
+        rights = 0
+        for ch in castling:
+            rights |= CASTLING_BITS.get(ch, 0)
         ep_sq = None if ep == '-' else square_index(ep)
         return State(
-            board=board,
-            to_move='w' if active == 'w' else 'b',
+            squares=array('b', codes),
+            to_move=WHITE if active == 'w' else BLACK,
             castling_rights=rights,
             en_passant=ep_sq,
             halfmove_clock=int(halfmove),
             fullmove_number=int(fullmove),
-            history=[],
         )
 
     def clone(self) -> 'State':
-        return State(
-            board=self.board[:],
-            to_move=self.to_move,
-            castling_rights=set(self.castling_rights),
-            en_passant=self.en_passant,
+        state = State(
+            squares=self.squares[:],
+            to_move=self._to_move,
+            castling_rights=self._castling_rights,
+            en_passant=self._en_passant,
             halfmove_clock=self.halfmove_clock,
             fullmove_number=self.fullmove_number,
-            history=[h.clone() for h in self.history],
+            bb=self.bb[:],
+            occ_w=self.occ_w,
+            occ_b=self.occ_b,
+            occ=self.occ,
+            key=self.key,
         )
+        # the memos are immutable, so the copy can share them
+        state._legal_cache = self._legal_cache
+        state._legal_set_cache = self._legal_set_cache
+        return state
+
+
+def _ep_key(state: State) -> int:
+    """The en passant term of ``state``'s Zobrist key.
 
+    The square only counts when a pawn of the side to move attacks it;
+    otherwise the position is the same as without it and must hash equal.
+    """
+    ep = state._en_passant
+    if ep is not None:
+        color = state._to_move
+        if PAWN_ATTACKS[color ^ 1][ep] & state.bb[PAWN | color << 3]:
+            return ZOBRIST_EP[ep % 8]
+    return 0
 
-def color_of(piece: str) -> str:
-    return 'w' if piece.isupper() else 'b'
 
+def zobrist_key(state: State) -> int:
+    """Compute the Zobrist hash of ``state`` from scratch."""
+    key = ZOBRIST_CASTLE[state._castling_rights]
+    # a plain scan beats bit iteration here: a full board has ~32 pieces
+    # and each LSB step costs more than skipping an empty square
+    for idx, code in enumerate(state.squares):
+        if code:
+            key ^= ZOBRIST_PIECE[code][idx]
+    if state._to_move:
+        key ^= ZOBRIST_SIDE
+    return key ^ _ep_key(state)
 
-def opposite(color: str) -> str:
-    return 'b' if color == 'w' else 'w'
+
+def color_of(piece: str) -> int:
+    return WHITE if piece.isupper() else BLACK
+
+
+def opposite(color: int) -> int:
+    return color ^ 1
 
 
 def piece_at(state: State, row: int, col: int) -> Optional[str]:
-    return state.board[row * 8 + col]
+    return SYMBOLS[state.squares[row * 8 + col]]
 
 
 def set_piece(state: State, row: int, col: int, piece: Optional[str]) -> None:
-    state.board[row * 8 + col] = piece
+    _set_square(state, row * 8 + col, PIECE_CODES[piece] if piece else EMPTY)
 
 
-def is_square_attacked(state: State, row: int, col: int, attacker: str) -> bool:
-    board = state.board
-    # Pawn attacks
-    directions = [(-1, -1), (-1, 1)] if attacker == 'w' else [(1, -1), (1, 1)]
-    pawn = 'P' if attacker == 'w' else 'p'
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-        if 0 <= r < 8 and 0 <= c < 8:
-            if board[r * 8 + c] == pawn:
-                return True
-    # Knight
-    for dr, dc in KNIGHT_OFFSETS:
-        r, c = row + dr, col + dc
-        if 0 <= r < 8 and 0 <= c < 8:
-            piece = board[r * 8 + c]
-            if piece and piece.lower() == 'n' and color_of(piece) == attacker:
-                return True
-    # Bishop/Queen
-    for dr, dc in BISHOP_OFFSETS:
-        r, c = row + dr, col + dc
-        while 0 <= r < 8 and 0 <= c < 8:
-            piece = board[r * 8 + c]
-            if piece:
-                if color_of(piece) == attacker and piece.lower() in ('b', 'q'):
-                    return True
-                break
-            r += dr
-            c += dc
-    # Rook/Queen
-    for dr, dc in ROOK_OFFSETS:
-        r, c = row + dr, col + dc
-        while 0 <= r < 8 and 0 <= c < 8:
-            piece = board[r * 8 + c]
-            if piece:
-                if color_of(piece) == attacker and piece.lower() in ('r', 'q'):
-                    return True
-                break
-            r += dr
-            c += dc
-    # King
-    for dr, dc in KING_OFFSETS:
-        r, c = row + dr, col + dc
-        if 0 <= r < 8 and 0 <= c < 8:
-            piece = board[r * 8 + c]
-            if piece and piece.lower() == 'k' and color_of(piece) == attacker:
-                return True
-    return False
-
-
-def king_position(state: State, color: str) -> Optional[tuple[int, int]]:
-    target = 'K' if color == 'w' else 'k'
-    for idx, piece in enumerate(state.board):
-        if piece == target:
-            return idx // 8, idx % 8
-    return None
+def _set_square(state: State, sq: int, code: int) -> None:
+    """Write piece ``code`` to board index ``sq`` keeping the bitboards in sync."""
+    bit = 1 << sq
+    old = state.squares[sq]
+    if old:
+        state.bb[old] ^= bit
+        state.key ^= ZOBRIST_PIECE[old][sq]
+        if old & BLACK_BIT:
+            state.occ_b ^= bit
+        else:
+            state.occ_w ^= bit
+    if code:
+        state.bb[code] ^= bit
+        state.key ^= ZOBRIST_PIECE[code][sq]
+        if code & BLACK_BIT:
+            state.occ_b ^= bit
+        else:
+            state.occ_w ^= bit
+    state.occ = state.occ_w | state.occ_b
+    state.squares[sq] = code
+
+
+def is_square_attacked(state: State, row: int, col: int, attacker: int) -> bool:
+    return is_sq_attacked_bb(state, row * 8 + col, attacker)
+
+
+def is_sq_attacked_bb(state: State, sq: int, attacker: int) -> bool:
+    """Return whether any piece of ``attacker`` attacks board index ``sq``."""
+    bb = state.bb
+    occ = state.occ
+    # an attacking pawn sits where an opposing pawn on sq would capture
+    if attacker == WHITE:
+        return bool(
+            PAWN_ATTACKS_B[sq] & bb[WP]
+            or KNIGHT_ATTACKS[sq] & bb[WN]
+            or KING_ATTACKS[sq] & bb[WK]
+            or BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]] & (bb[WB] | bb[WQ])
+            or ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]] & (bb[WR] | bb[WQ])
+        )
+    return bool(
+        PAWN_ATTACKS_W[sq] & bb[BP]
+        or KNIGHT_ATTACKS[sq] & bb[BN]
+        or KING_ATTACKS[sq] & bb[BK]
+        or BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]] & (bb[BB] | bb[BQ])
+        or ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]] & (bb[BR] | bb[BQ])
+    )
+
+
+def attackers_to(state: State, sq: int, attacker: int, occ: int) -> int:
+    """Bitboard of ``attacker``'s pieces attacking ``sq`` given occupancy ``occ``."""
+    bb = state.bb
+    if attacker == WHITE:
+        return (
+            PAWN_ATTACKS_B[sq] & bb[WP]
+            | KNIGHT_ATTACKS[sq] & bb[WN]
+            | KING_ATTACKS[sq] & bb[WK]
+            | BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]] & (bb[WB] | bb[WQ])
+            | ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]] & (bb[WR] | bb[WQ])
+        )
+    return (
+        PAWN_ATTACKS_W[sq] & bb[BP]
+        | KNIGHT_ATTACKS[sq] & bb[BN]
+        | KING_ATTACKS[sq] & bb[BK]
+        | BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]] & (bb[BB] | bb[BQ])
+        | ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]] & (bb[BR] | bb[BQ])
+    )
+
+
+def attacked_squares(state: State, color: int, occ: int) -> int:
+    """Bitboard of squares attacked by ``color``'s pieces given occupancy ``occ``."""
+    bb = state.bb
+    if color == WHITE:
+        king = bb[WK]
+        diag, orth = bb[WB] | bb[WQ], bb[WR] | bb[WQ]
+    else:
+        king = bb[BK]
+        diag, orth = bb[BB] | bb[BQ], bb[BR] | bb[BQ]
+    # pawns and knights are shifted as whole sets; sliders need the tables
+    attacked = pawn_attack_set(bb[PAWN | color << 3], color)
+    attacked |= knight_attack_set(bb[KNIGHT | color << 3])
+    if king:
+        attacked |= KING_ATTACKS[king.bit_length() - 1]
+    while diag:
+        lsb = diag & -diag
+        diag ^= lsb
+        sq = lsb.bit_length() - 1
+        attacked |= BISHOP_ATTACKS[sq][occ & BISHOP_MASK[sq]]
+    while orth:
+        lsb = orth & -orth
+        orth ^= lsb
+        sq = lsb.bit_length() - 1
+        attacked |= ROOK_ATTACKS[sq][occ & ROOK_MASK[sq]]
+    return attacked
+
+
+def compute_checkers(state: State, color: int) -> int:
+    """Bitboard of enemy pieces giving check to ``color``'s king."""
+    king = state.bb[KING | color << 3]
+    if not king:
+        return 0
+    return attackers_to(state, king.bit_length() - 1, opposite(color), state.occ)
+
+
+def compute_pins(state: State, color: int) -> int:
+    """Bitboard of ``color``'s pieces pinned against their own king."""
+    bb = state.bb
+    if color == WHITE:
+        king, own = bb[WK], state.occ_w
+        orth, diag = bb[BR] | bb[BQ], bb[BB] | bb[BQ]
+    else:
+        king, own = bb[BK], state.occ_b
+        orth, diag = bb[WR] | bb[WQ], bb[WB] | bb[WQ]
+    if not king:
+        return 0
+    ksq = king.bit_length() - 1
+    # enemy sliders that would hit the king on an empty board
+    snipers = ROOK_ATTACKS[ksq][0] & orth | BISHOP_ATTACKS[ksq][0] & diag
+    between = BETWEEN[ksq]
+    occ = state.occ
+    pinned = 0
+    while snipers:
+        lsb = snipers & -snipers
+        snipers ^= lsb
+        blockers = between[lsb.bit_length() - 1] & occ
+        if blockers & own and not blockers & (blockers - 1):
+            pinned |= blockers
+    return pinned
 
 
-def in_check(state: State, color: str) -> bool:
-    pos = king_position(state, color)
-    if not pos:
+def king_position(state: State, color: int) -> Optional[tuple[int, int]]:
+    king = state.bb[KING | color << 3]
+    if not king:
+        return None
+    return divmod(king.bit_length() - 1, 8)
+
+
+def in_check(state: State, color: int) -> bool:
+    king = state.bb[KING | color << 3]
+    if not king:
         return False
-    return is_square_attacked(state, pos[0], pos[1], opposite(color))
+    return is_sq_attacked_bb(state, king.bit_length() - 1, opposite(color))
+
 
+def add_castling_moves(
+    moves: List[Move], state: State, idx: int, attacked: Optional[int] = None
+) -> None:
+    """Add the castling moves available to the king on board index ``idx``.
 
-def add_move(moves: List[Move], from_sq: int, to_sq: int, promotion: Optional[str] = None) -> None:
-    moves.append(Move(from_sq, to_sq, promotion))
+    ``attacked`` is the enemy attack bitboard if the caller already has it.
+    """
+    color = state._to_move
+    home, paths = CASTLE_PATHS[color]
+    rights = state._castling_rights
+    if idx != home or not rights & (paths[0][0] | paths[1][0]):
+        return
+    occ = state.occ
+    squares = state.squares
+    rook = ROOK | color << 3
+    for right, king_to, rook_sq, empty, safe in paths:
+        if rights & right and not occ & empty and squares[rook_sq] == rook:
+            # the enemy attack map is only built once a path is clear
+            if attacked is None:
+                attacked = attacked_squares(state, opposite(color), occ)
+            if not attacked & safe:
+                moves.append(MOVE_TABLE[idx][king_to])
 
 
 def generate_pseudo_legal_moves(state: State) -> List[Move]:
+    """Generate moves that obey piece movement but may leave the king in check.
+
+    Works purely on the piece bitboards: each piece type is walked bit by
+    bit and its targets come from the attack tables.
+    """
+    return _generate_moves(state, False)
+
+
+def generate_legal_moves(state: State, use_cache: bool = True) -> List[Move]:
+    """Return the legal moves of ``state`` as a fresh list.
+
+    The moves are memoized on the state under its Zobrist key as a tuple,
+    so the caller owns the returned list and may modify it. With
+    ``use_cache`` off the memo is neither read nor written, which suits
+    perft-style walks that never revisit a position.
+    """
+    if not use_cache:
+        return _generate_moves(state, True)
+    return list(_legal_moves(state))
+
+
+def _legal_moves(state: State) -> Tuple[Move, ...]:
+    """The memoized legal moves of ``state``, generated if cold."""
+    cache = state._legal_cache
+    if cache is not None and cache[0] == state.key:
+        return cache[1]
+    moves = tuple(_generate_moves(state, True))
+    state._legal_cache = (state.key, moves)
+    return moves
+
+
+# Per-piece-type generators: each takes the move list, a piece bitboard and
+# the mask of allowed target squares and appends interned moves, walking
+# bits by LSB.
+def _gen_pawn_moves(
+    moves: List[Move], pawn_targets: _PawnTargets, pawns: int, empty: int,
+    capturable: int, mask: int, promo_rank: int,
+) -> None:
+    """Unpinned pawns, shifted as one set by the side's ``pawn_targets``."""
+    append = moves.append
+    extend = moves.extend
+    for targets, delta in pawn_targets(pawns, empty, capturable):
+        targets &= mask
+        promos = targets & promo_rank
+        targets ^= promos
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            to = lsb.bit_length() - 1
+            append(MOVE_TABLE[to + delta][to])
+        while promos:
+            lsb = promos & -promos
+            promos ^= lsb
+            to = lsb.bit_length() - 1
+            extend(PROMOTION_MOVES[to + delta][to])
+
+
+def _gen_knight_moves(moves: List[Move], knights: int, mask: int) -> None:
+    append = moves.append
+    while knights:
+        lsb = knights & -knights
+        knights ^= lsb
+        frm = lsb.bit_length() - 1
+        targets = KNIGHT_ATTACKS[frm] & mask
+        row = MOVE_TABLE[frm]
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            append(row[lsb.bit_length() - 1])
+
+
+def _gen_slider_moves(
+    moves: List[Move], sliders: int, occ: int, mask: int,
+    attacks: Tuple[Dict[int, int], ...], blockers: Tuple[int, ...],
+    pinned: int, pin_line: Tuple[int, ...],
+) -> None:
+    """Bishop-like or rook-like pieces, given that direction's tables."""
+    append = moves.append
+    while sliders:
+        lsb = sliders & -sliders
+        sliders ^= lsb
+        frm = lsb.bit_length() - 1
+        targets = attacks[frm][occ & blockers[frm]] & mask
+        if lsb & pinned:
+            targets &= pin_line[frm]
+        row = MOVE_TABLE[frm]
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            append(row[lsb.bit_length() - 1])
+
+
+def _gen_king_moves(moves: List[Move], frm: int, mask: int) -> None:
+    append = moves.append
+    targets = KING_ATTACKS[frm] & mask
+    row = MOVE_TABLE[frm]
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        append(row[lsb.bit_length() - 1])
+
+
+def _generate_moves(state: State, legal: bool) -> List[Move]:
+    """Bitboard move generator shared by the pseudo-legal and legal entry points.
+
+    With ``legal`` set, check evasions and pins are applied as masks on each
+    piece's target set and king steps are masked with the enemy attack map,
+    so only en passant captures need a per-move test.
+    """
     moves: List[Move] = []
-    color = state.to_move
-    for idx, piece in enumerate(state.board):
-        if not piece or color_of(piece) != color:
-            continue
-        row, col = divmod(idx, 8)
-        if piece.lower() == 'p':
-            dir = -1 if color == 'w' else 1
-            start = 6 if color == 'w' else 1
-            promo_row = 0 if color == 'w' else 7
-            # one forward
-            r = row + dir
-            if 0 <= r < 8 and piece_at(state, r, col) is None:
-                if r == promo_row:
-                    for p in 'qrbn':
-                        add_move(moves, idx, r * 8 + col, p)
-                else:
-                    add_move(moves, idx, r * 8 + col)
-                # double
-                if row == start and piece_at(state, r + dir, col) is None:
-                    add_move(moves, idx, (r + dir) * 8 + col)
-            # captures
-            for dc in (-1, 1):
-                c = col + dc
-                r = row + dir
-                if 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if target and color_of(target) != color:
-                        if r == promo_row:
-                            for p in 'qrbn':
-                                add_move(moves, idx, r * 8 + c, p)
-                        else:
-                            add_move(moves, idx, r * 8 + c)
-                    elif state.en_passant == r * 8 + c:
-                        add_move(moves, idx, r * 8 + c)
-        elif piece.lower() == 'n':
-            for dr, dc in KNIGHT_OFFSETS:
-                r, c = row + dr, col + dc
-                if 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if not target or color_of(target) != color:
-                        add_move(moves, idx, r * 8 + c)
-        elif piece.lower() == 'b':
-            for dr, dc in BISHOP_OFFSETS:
-                r, c = row + dr, col + dc
-                while 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if target:
-                        if color_of(target) != color:
-                            add_move(moves, idx, r * 8 + c)
-                        break
-                    add_move(moves, idx, r * 8 + c)
-                    r += dr
-                    c += dc
-        elif piece.lower() == 'r':
-            for dr, dc in ROOK_OFFSETS:
-                r, c = row + dr, col + dc
-                while 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if target:
-                        if color_of(target) != color:
-                            add_move(moves, idx, r * 8 + c)
-                        break
-                    add_move(moves, idx, r * 8 + c)
-                    r += dr
-                    c += dc
-        elif piece.lower() == 'q':
-            for dr, dc in BISHOP_OFFSETS + ROOK_OFFSETS:
-                r, c = row + dr, col + dc
-                while 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if target:
-                        if color_of(target) != color:
-                            add_move(moves, idx, r * 8 + c)
-                        break
-                    add_move(moves, idx, r * 8 + c)
-                    r += dr
-                    c += dc
-        elif piece.lower() == 'k':
-            for dr, dc in KING_OFFSETS:
-                r, c = row + dr, col + dc
-                if 0 <= r < 8 and 0 <= c < 8:
-                    target = piece_at(state, r, c)
-                    if not target or color_of(target) != color:
-                        add_move(moves, idx, r * 8 + c)
-            # castling
-            if color == 'w' and row == 7 and col == 4:
-                if 'K' in state.castling_rights:
-                    if piece_at(state, 7, 5) is None and piece_at(state, 7, 6) is None:
-                        if not in_check(state, 'w') and not is_square_attacked(state, 7, 5, 'b') and not is_square_attacked(state, 7, 6, 'b') and piece_at(state, 7, 7) == 'R':
-                            add_move(moves, idx, 7 * 8 + 6)
-                if 'Q' in state.castling_rights:
-                    if piece_at(state, 7, 3) is None and piece_at(state, 7, 2) is None and piece_at(state, 7, 1) is None:
-                        if not in_check(state, 'w') and not is_square_attacked(state, 7, 3, 'b') and not is_square_attacked(state, 7, 2, 'b') and piece_at(state, 7, 0) == 'R':
-                            add_move(moves, idx, 7 * 8 + 2)
-            if color == 'b' and row == 0 and col == 4:
-                if 'k' in state.castling_rights:
-                    if piece_at(state, 0, 5) is None and piece_at(state, 0, 6) is None:
-                        if not in_check(state, 'b') and not is_square_attacked(state, 0, 5, 'w') and not is_square_attacked(state, 0, 6, 'w') and piece_at(state, 0, 7) == 'r':
-                            add_move(moves, idx, 0 * 8 + 6)
-                if 'q' in state.castling_rights:
-                    if piece_at(state, 0, 3) is None and piece_at(state, 0, 2) is None and piece_at(state, 0, 1) is None:
-                        if not in_check(state, 'b') and not is_square_attacked(state, 0, 3, 'w') and not is_square_attacked(state, 0, 2, 'w') and piece_at(state, 0, 0) == 'r':
-                            add_move(moves, idx, 0 * 8 + 2)
+    append = moves.append
+    extend = moves.extend
+    bb = state.bb
+    occ = state.occ
+    color = state._to_move
+    if color == WHITE:
+        own, enemy = state.occ_w, state.occ_b
+        pawns, knights, king = bb[WP], bb[WN], bb[WK]
+        diag, orth = bb[WB] | bb[WQ], bb[WR] | bb[WQ]
+        pawn_targets, promo_rank = _white_pawn_targets, RANK_8
+        pawn_attacks, step, start_row, promo_row = PAWN_ATTACKS_W, -8, 6, 0
+    else:
+        own, enemy = state.occ_b, state.occ_w
+        pawns, knights, king = bb[BP], bb[BN], bb[BK]
+        diag, orth = bb[BB] | bb[BQ], bb[BR] | bb[BQ]
+        pawn_targets, promo_rank = _black_pawn_targets, RANK_1
+        pawn_attacks, step, start_row, promo_row = PAWN_ATTACKS_B, 8, 1, 7
+    ep = state._en_passant
+    # a king-less side (test positions) has nothing to keep out of check
+    legal = legal and bool(king)
+    if legal:
+        ksq = king.bit_length() - 1
+        # with the king lifted off the board, so it cannot step back along
+        # a checking ray
+        attacked = attacked_squares(state, opposite(color), occ ^ king)
+        checkers = compute_checkers(state, color) if attacked & king else 0
+        pinned = compute_pins(state, color)
+        if checkers & (checkers - 1):
+            evasions = 0  # double check: only the king may move
+            pawns = knights = diag = orth = 0
+        elif checkers:
+            evasions = checkers | BETWEEN[ksq][checkers.bit_length() - 1]
+        else:
+            evasions = ~0
+        # en passant can expose the king along a rank, so it is tried below
+        capturable = enemy
+        pin_line = LINE[ksq]
+    else:
+        pinned = 0
+        evasions = ~0
+        capturable = enemy if ep is None else enemy | 1 << ep
+        pin_line = _NO_PIN_LINE  # nothing is pinned without a legality test
+    not_own = ~own & evasions
+    ep_pawns = 0
+    if legal and ep is not None:
+        # own pawns attacking the en passant square: a pawn seen from there
+        # with the other side's capture pattern
+        ep_pawns = pawns & PAWN_ATTACKS[color ^ 1][ep]
+
+    _gen_pawn_moves(
+        moves, pawn_targets, pawns & ~pinned, ~occ & BB_ALL, capturable,
+        evasions, promo_rank,
+    )
+
+    # pinned pawns, one at a time along their pin line
+    pawns &= pinned
+    while pawns:
+        lsb = pawns & -pawns
+        pawns ^= lsb
+        frm = lsb.bit_length() - 1
+        to = frm + step
+        targets = pawn_attacks[frm] & capturable
+        if not occ >> to & 1:
+            targets |= 1 << to
+            if frm >> 3 == start_row and not occ >> (to + step) & 1:
+                targets |= 1 << (to + step)
+        targets &= evasions & pin_line[frm]
+        if to >> 3 == promo_row:
+            promos = PROMOTION_MOVES[frm]
+            while targets:
+                lsb = targets & -targets
+                targets ^= lsb
+                extend(promos[lsb.bit_length() - 1])
+        else:
+            row = MOVE_TABLE[frm]
+            while targets:
+                lsb = targets & -targets
+                targets ^= lsb
+                append(row[lsb.bit_length() - 1])
+
+    while ep_pawns:
+        lsb = ep_pawns & -ep_pawns
+        ep_pawns ^= lsb
+        mv = MOVE_TABLE[lsb.bit_length() - 1][ep]
+        undo = apply_move_inplace(state, mv)
+        if not in_check(state, color):
+            append(mv)
+        undo_move_inplace(state, mv, undo)
+
+    # a pinned knight can never stay on its pin line
+    _gen_knight_moves(moves, knights & ~pinned, not_own)
+    _gen_slider_moves(moves, diag, occ, not_own, BISHOP_ATTACKS, BISHOP_MASK, pinned, pin_line)
+    _gen_slider_moves(moves, orth, occ, not_own, ROOK_ATTACKS, ROOK_MASK, pinned, pin_line)
+    if king:
+        frm = king.bit_length() - 1
+        _gen_king_moves(moves, frm, ~own & ~attacked if legal else ~own)
+        add_castling_moves(moves, state, frm, attacked if legal else None)
     return moves
 
 
-def generate_legal_moves(state: State) -> List[Move]:
-    moves = []
-    for mv in generate_pseudo_legal_moves(state):
-        tmp = state.clone()
-        apply_move(tmp, mv)
-        # nach apply_move ist tmp.to_move der Gegner,
-        # also opposite(tmp.to_move) ist der Spieler, der gezogen hat
-        if not in_check(tmp, opposite(tmp.to_move)):
-            moves.append(mv)
+def legal_move_set(state: State, use_cache: bool = True) -> FrozenSet[Move]:
+    """Return the legal moves of ``state`` as a frozenset for O(1) membership."""
+    if not use_cache:
+        return frozenset(_generate_moves(state, True))
+    cache = state._legal_set_cache
+    if cache is not None and cache[0] == state.key:
+        return cache[1]
+    moves = frozenset(_legal_moves(state))
+    state._legal_set_cache = (state.key, moves)
     return moves
 
 
-def apply_move(state: State, move: Move) -> None:
-    board = state.board
-    piece = board[move.from_sq]
-    rights = set(state.castling_rights)
-    row_from, col_from = divmod(move.from_sq, 8)
-    row_to, col_to = divmod(move.to_sq, 8)
-    capture = board[move.to_sq] is not None
-    # en passant capture
-    if piece.lower() == 'p' and move.to_sq == state.en_passant and board[move.to_sq] is None:
-        if state.to_move == 'w':
-            board[(row_to + 1) * 8 + col_to] = None
+def cached_legal_moves(state: State) -> Optional[Tuple[Move, ...]]:
+    """Return the memoized legal moves of ``state``, or ``None`` if cold."""
+    cache = state._legal_cache
+    if cache is not None and cache[0] == state.key:
+        return cache[1]
+    return None
+
+
+def is_legal(state: State, move: Move) -> bool:
+    """Return whether ``move`` is legal in ``state`` without generating all moves."""
+    frm = move & 63
+    to = move >> 6 & 63
+    promo = move >> 12
+    color = state._to_move
+    if color == WHITE:
+        own, enemy = state.occ_w, state.occ_b
+    else:
+        own, enemy = state.occ_b, state.occ_w
+    if not own >> frm & 1 or own >> to & 1:
+        return False
+    occ = state.occ
+    kind = state.squares[frm] & 7
+    if kind == PAWN:
+        if color == WHITE:
+            step, start_row, promo_row, pawn_attacks = -8, 6, 0, PAWN_ATTACKS_W
+        else:
+            step, start_row, promo_row, pawn_attacks = 8, 1, 7, PAWN_ATTACKS_B
+        if to == frm + step:
+            valid = not occ >> to & 1
+        elif to == frm + 2 * step:
+            valid = (
+                frm // 8 == start_row
+                and not occ >> (frm + step) & 1
+                and not occ >> to & 1
+            )
         else:
-            board[(row_to - 1) * 8 + col_to] = None
-        capture = True
-    # move piece
-    board[move.from_sq] = None
-    board[move.to_sq] = piece
-    # promotion
-    if piece.lower() == 'p':
-        end_row = 0 if state.to_move == 'w' else 7
-        if row_to == end_row:
-            board[move.to_sq] = move.promotion.upper() if state.to_move == 'w' else move.promotion.lower() if move.promotion else piece
-    # castling move: move rook
-    if piece.lower() == 'k':
-        if abs(col_to - col_from) == 2:
-            if col_to == 6:  # kingside
-                rook_from = row_from * 8 + 7
-                rook_to = row_from * 8 + 5
-            else:  # queenside
-                rook_from = row_from * 8 + 0
-                rook_to = row_from * 8 + 3
-            board[rook_to] = board[rook_from]
-            board[rook_from] = None
-        # update castling rights
-        if state.to_move == 'w':
-            rights.discard('K')
-            rights.discard('Q')
+            valid = bool(
+                pawn_attacks[frm] >> to & 1
+                and (enemy >> to & 1 or to == state._en_passant)
+            )
+        if not valid:
+            return False
+        if to // 8 == promo_row:
+            if not KNIGHT <= promo <= QUEEN:
+                return False
+        elif promo:
+            return False
+    else:
+        if promo:
+            return False
+        if kind == KNIGHT:
+            targets = KNIGHT_ATTACKS[frm]
+        elif kind == BISHOP:
+            targets = bishop_attacks(frm, occ)
+        elif kind == ROOK:
+            targets = rook_attacks(frm, occ)
+        elif kind == QUEEN:
+            targets = queen_attacks(frm, occ)
         else:
-            rights.discard('k')
-            rights.discard('q')
-    # rook movement affects rights
-    if piece.lower() == 'r':
-        if move.from_sq == 7 * 8 + 0:
-            rights.discard('Q')
-        elif move.from_sq == 7 * 8 + 7:
-            rights.discard('K')
-        elif move.from_sq == 0 * 8 + 0:
-            rights.discard('q')
-        elif move.from_sq == 0 * 8 + 7:
-            rights.discard('k')
-    # capture rook affects rights
-    if capture:
-        if move.to_sq == 7 * 8 + 0:
-            rights.discard('Q')
-        elif move.to_sq == 7 * 8 + 7:
-            rights.discard('K')
-        elif move.to_sq == 0 * 8 + 0:
-            rights.discard('q')
-        elif move.to_sq == 0 * 8 + 7:
-
-            rights.discard('k')
-
-            state.castling_rights.discard('k')
-
-    mover = state.to_move
-    # en passant square
-    if piece.lower() == 'p' and abs(row_to - row_from) == 2:
-        ep_row = (row_from + row_to) // 2
-        state.en_passant = ep_row * 8 + col_to
+            targets = KING_ATTACKS[frm]
+            if not targets >> to & 1:
+                castles: List[Move] = []
+                add_castling_moves(castles, state, frm)
+                return move in castles
+        if not targets >> to & 1:
+            return False
+    undo = apply_move_inplace(state, move)
+    legal = not in_check(state, color)
+    undo_move_inplace(state, move, undo)
+    return legal
+
+
+class UndoInfo(NamedTuple):
+    """Everything :func:`undo_move_inplace` needs to take a move back."""
+
+    captured_piece: int  # piece code, EMPTY if nothing was captured
+    prev_ep: Optional[int]
+    prev_halfmove: int
+    prev_rights: int
+    prev_to_move: int
+    is_castle: bool
+    is_ep: bool
+    is_promo: bool
+    prev_key: int
+
+
+def apply_move(state: State, move: Move) -> None:
+    apply_move_inplace(state, move)
+
+
+def apply_move_inplace(state: State, move: Move) -> UndoInfo:
+    """Play ``move`` on ``state`` and return the record needed to undo it."""
+    squares = state.squares
+    bb = state.bb
+    frm = move & 63
+    to = move >> 6 & 63
+    piece = squares[frm]
+    kind = piece & 7
+    mover = state._to_move
+    prev_rights = state._castling_rights
+    prev_key = state.key
+    prev_ep = state._en_passant
+    captured = squares[to]
+    is_ep = is_castle = is_promo = False
+    # the mover and any piece on the target square are updated inline; the
+    # rarer special cases below go through _set_square
+    from_bit = 1 << frm
+    to_bit = 1 << to
+    key = prev_key
+    if prev_ep is not None:
+        # drop the en passant term while the pawns it depends on are in place
+        key ^= _ep_key(state)
+    zobrist = ZOBRIST_PIECE[piece]
+    key ^= zobrist[frm] ^ zobrist[to]
+    bb[piece] ^= from_bit | to_bit
+    if captured:
+        bb[captured] ^= to_bit
+        key ^= ZOBRIST_PIECE[captured][to]
+    if mover == WHITE:
+        state.occ_w ^= from_bit | to_bit
+        if captured:
+            state.occ_b ^= to_bit
     else:
-        state.en_passant = None
+        state.occ_b ^= from_bit | to_bit
+        if captured:
+            state.occ_w ^= to_bit
+    state.occ = state.occ_w | state.occ_b
+    squares[frm] = EMPTY
+    squares[to] = piece
+    state.key = key
+    if kind == PAWN:
+        if to == prev_ep:
+            # the en passant square is always empty, so nothing was taken yet
+            victim = to + 8 if mover == WHITE else to - 8
+            captured = squares[victim]
+            _set_square(state, victim, EMPTY)
+            is_ep = True
+        elif not 8 <= to < 56:
+            is_promo = True
+            if move >> 12:
+                _set_square(state, to, move >> 12 | piece & BLACK_BIT)
+    elif kind == KING and abs(to - frm) == 2:
+        is_castle = True
+        if to > frm:  # kingside
+            rook_from, rook_to = frm + 3, frm + 1
+        else:  # queenside
+            rook_from, rook_to = frm - 4, frm - 1
+        _set_square(state, rook_to, squares[rook_from])
+        _set_square(state, rook_from, EMPTY)
+    rights = prev_rights & CASTLE_MASK[frm] & CASTLE_MASK[to]
+
+    undo = UndoInfo(
+        captured, prev_ep, state.halfmove_clock, prev_rights,
+        mover, is_castle, is_ep, is_promo, prev_key,
+    )
+
+    # en passant square: only a double pawn push has a table entry
+    state._en_passant = ep = EP_TARGET[move & 0xFFF] if kind == PAWN else None
 
     # halfmove clock
-    if piece.lower() == 'p' or capture:
+    if kind == PAWN or captured:
         state.halfmove_clock = 0
     else:
         state.halfmove_clock += 1
 
-    # fullmove number
-    if mover == 'b':
+    # fullmove number and side to move
+    if mover == BLACK:
         state.fullmove_number += 1
+    state._to_move = mover ^ 1
 
+    state._castling_rights = rights
+    key = state.key ^ ZOBRIST_SIDE
+    if ep is not None:
+        key ^= _ep_key(state)
+    if rights != prev_rights:
+        key ^= ZOBRIST_CASTLE[prev_rights] ^ ZOBRIST_CASTLE[rights]
+    state.key = key
+    return undo
 
-    # keep castling rights ordered as set
-    state.castling_rights = {c for c in "KQkq" if c in state.castling_rights}
 
+def undo_move_inplace(state: State, move: Move, undo: UndoInfo) -> None:
+    """Reverse :func:`apply_move_inplace` using the record it returned."""
+    color = undo.prev_to_move
+    squares = state.squares
+    bb = state.bb
+    frm = move & 63
+    to = move >> 6 & 63
+    if undo.is_promo:
+        _set_square(state, to, PAWN | color << 3)
+    if undo.is_castle:
+        if to > frm:
+            rook_from, rook_to = frm + 3, frm + 1
+        else:
+            rook_from, rook_to = frm - 4, frm - 1
+        _set_square(state, rook_from, squares[rook_to])
+        _set_square(state, rook_to, EMPTY)
+    # the key is restored wholesale below, so the inline part skips it
+    piece = squares[to]
+    captured = undo.captured_piece
+    from_bit = 1 << frm
+    to_bit = 1 << to
+    bb[piece] ^= from_bit | to_bit
+    squares[frm] = piece
+    squares[to] = EMPTY
+    if color == WHITE:
+        state.occ_w ^= from_bit | to_bit
+    else:
+        state.occ_b ^= from_bit | to_bit
+    if undo.is_ep:
+        _set_square(state, to + 8 if color == WHITE else to - 8, captured)
+    elif captured:
+        bb[captured] ^= to_bit
+        squares[to] = captured
+        if color == WHITE:
+            state.occ_b ^= to_bit
+        else:
+            state.occ_w ^= to_bit
+    state.occ = state.occ_w | state.occ_b
+    state._castling_rights = undo.prev_rights
+    state._en_passant = undo.prev_ep
+    state.halfmove_clock = undo.prev_halfmove
+    state._to_move = color
+    state.key = undo.prev_key
+    if color == BLACK:
+        state.fullmove_number -= 1
 
-    # switch side
-    state.to_move = opposite(state.to_move)
-
-    # keep rights in canonical order for FEN export
-    state.castling_rights = ''.join(c for c in "KQkq" if c in rights)
 
-def is_checkmate(state: State) -> bool:
-    if in_check(state, state.to_move) and not generate_legal_moves(state):
-        return True
-    return False
+# Both tests look at the memoized moves first: a side with moves is
+# neither mated nor stalemated, so the check test only runs at the end.
+def is_checkmate(state: State, use_cache: bool = True) -> bool:
+    moves = _legal_moves(state) if use_cache else _generate_moves(state, True)
+    return not moves and in_check(state, state._to_move)
 
 
-def is_stalemate(state: State) -> bool:
-    if not in_check(state, state.to_move) and not generate_legal_moves(state):
-        return True
-    return False
+def is_stalemate(state: State, use_cache: bool = True) -> bool:
+    moves = _legal_moves(state) if use_cache else _generate_moves(state, True)
+    return not moves and not in_check(state, state._to_move)
 
 
 def is_draw_by_fifty_moves(state: State) -> bool:
@@ -406,10 +1244,14 @@ def is_draw_by_fifty_moves(state: State) -> bool:
 
 
 def is_insufficient_material(state: State) -> bool:
-    pieces = [p for p in state.board if p]
-    pieces = [p.lower() for p in pieces if p.lower() != 'k']
-    if not pieces:
-        return True
-    if pieces in (['n'], ['b']):
+    bb = state.bb
+    if bb[WP] | bb[BP] | bb[WR] | bb[BR] | bb[WQ] | bb[BQ]:
+        return False
+    knights = bb[WN] | bb[BN]
+    bishops = bb[WB] | bb[BB]
+    if (knights | bishops).bit_count() <= 1:
         return True
-    return False
+    # only bishops left, all on squares of one colour
+    return not knights and (
+        not bishops & LIGHT_SQUARES or not bishops & ~LIGHT_SQUARES
+    )
@@ -0,0 +1,19 @@
+import copy
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from chessgpt import Board
+
+
+@pytest.fixture(scope="session")
+def board_factory():
+    """Return ``make(fen=None)`` giving a fresh Board, parsing each FEN once."""
+    cache = {}
+
+    def make(fen=None):
+        if fen not in cache:
+            cache[fen] = Board(fen)
+        return copy.deepcopy(cache[fen])
+
+    return make
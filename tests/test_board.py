@@ -1,6 +1,9 @@
 import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import copy
+
+import pytest
 
 from chessgpt import Board, rules
 
@@ -11,10 +14,10 @@ def test_castling_moves():
     mv = rules.Move.from_uci('e1g1')
     assert mv in board.get_legal_moves()
     board.make_move(mv)
-    assert 'K' not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_WK
     mv2 = rules.Move.from_uci('e8c8')
     board.make_move(mv2)
-    assert 'k' not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_BK
 
 
 def test_illegal_castling_due_to_attack():
@@ -30,7 +33,7 @@ def test_castling_rights_lost_after_king_move():
     board.make_move(rules.Move.from_uci('e1f1'))
     board.make_move(rules.Move.from_uci('e8e7'))
     board.make_move(rules.Move.from_uci('f1e1'))
-    assert 'K' not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_WK
     assert rules.Move.from_uci('e1g1') not in board.get_legal_moves()
 
 
@@ -94,6 +97,16 @@ def test_fifty_move_rule_draw():
     assert board.is_draw_by_fifty_moves()
 
 
+def test_halfmove_clock_forwards_to_state():
+    board = Board('8/8/8/8/8/8/8/K1k5 w - - 99 1')
+    assert board.halfmove_clock == 99
+    board.make_move(rules.Move.from_uci('a1a2'))
+    assert board.halfmove_clock == 100
+    assert board.is_draw_by_fifty_moves()
+    board.undo_move()
+    assert board.halfmove_clock == 99
+
+
 def test_halfmove_clock_resets_on_pawn_move():
     fen = '8/8/p7/8/8/8/P7/K1k5 w - - 99 1'
     board = Board(fen)
@@ -112,6 +125,47 @@ def test_halfmove_clock_resets_on_capture():
     assert not board.is_draw_by_fifty_moves()
 
 
+def test_repetition_counts_positions_since_last_pawn_move():
+    board = Board()
+    assert board.is_repetition(1)
+    assert not board.is_repetition(2)
+    shuffle = ['g1f3', 'g8f6', 'f3g1', 'f6g8']
+    for uci in shuffle:
+        board.make_move(rules.Move.from_uci(uci))
+    assert board.is_repetition(2)
+    assert not board.is_draw_by_repetition()
+    for uci in shuffle:
+        board.make_move(rules.Move.from_uci(uci))
+    assert board.is_draw_by_repetition()
+    board.undo_move()
+    assert not board.is_draw_by_repetition()
+    board.make_move(rules.Move.from_uci('f6g8'))
+    board.make_move(rules.Move.from_uci('e2e4'))
+    board.make_move(rules.Move.from_uci('e7e5'))
+    assert not board.is_repetition(2)
+
+
+def test_repetition_ignores_uncapturable_en_passant_square():
+    board = Board()
+    line = ['e2e4', 'g8f6', 'g1f3', 'f6g8', 'f3g1', 'g8f6', 'g1f3', 'f6g8', 'f3g1']
+    for uci in line:
+        board.make_move(rules.Move.from_uci(uci))
+    assert board.is_draw_by_repetition()
+
+
+def test_deepcopy_is_independent():
+    board = Board()
+    board.make_move(rules.Move.from_uci('e2e4'))
+    board.get_legal_moves()
+    twin = copy.deepcopy(board)
+    twin.make_move(rules.Move.from_uci('e7e5'))
+    assert board.state.board[rules.square_index('e5')] is None
+    assert board.state.to_move == rules.BLACK
+    twin.undo_move()
+    twin.undo_move()
+    assert len(board.history) == 1
+
+
 import chess
 from chessgpt.board import ChessBoard
 
@@ -152,3 +206,13 @@ def test_undo_series_returns_to_start():
     assert board.board.board_fen() == chess.Board().board_fen()
     assert board.board.turn == chess.WHITE
 
+
+
+def test_undo_uses_move_stack():
+    board = ChessBoard()
+    board.make_move(chess.Move.from_uci('g1f3'))
+    assert board.board.move_stack == [chess.Move.from_uci('g1f3')]
+    board.undo_move()
+    assert board.board.move_stack == []
+    with pytest.raises(ValueError):
+        board.undo_move()
@@ -8,10 +8,11 @@ def snapshot(state):
     return (
         tuple(state.board),
         state.to_move,
-        frozenset(state.castling_rights),
+        state.castling_rights,
         state.en_passant,
         state.halfmove_clock,
         state.fullmove_number,
+        state.key,
     )
 
 
@@ -51,3 +52,27 @@ def test_undo_promotion():
     board.make_move(rules.Move.from_uci("a7a8q"))
     board.undo_move()
     assert snapshot(board.state) == before
+
+
+def test_inplace_apply_and_undo_restore_state():
+    fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    state = rules.State.from_fen(fen)
+    before = snapshot(state)
+    for mv in rules.generate_legal_moves(state):
+        undo = rules.apply_move_inplace(state, mv)
+        rules.undo_move_inplace(state, mv, undo)
+        assert snapshot(state) == before
+
+
+def test_undo_log_keeps_state_object():
+    board = Board()
+    state = board.state
+    board.get_legal_moves()
+    moves = rules.cached_legal_moves(board.state)
+    board.make_move(rules.Move.from_uci("g1f3"))
+    move, undo, _ = board.history[-1]
+    assert move == rules.Move.from_uci("g1f3")
+    assert undo.prev_to_move == rules.WHITE
+    board.undo_move()
+    assert board.state is state
+    assert rules.cached_legal_moves(board.state) is moves
@@ -1,6 +1,11 @@
 import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import copy
+import pickle
+import random
+
+import pytest
 from chessgpt import Board, rules
 
 
@@ -16,3 +21,282 @@ def test_move_leaving_king_in_check_disallowed():
     board = Board(fen)
     illegal_move = rules.Move.from_uci("e2f2")
     assert illegal_move not in board.get_legal_moves()
+
+
+def test_king_cannot_step_into_pawn_attack():
+    fen = "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"
+    board = Board(fen)
+    assert rules.Move.from_uci("a5b6") not in board.get_legal_moves()
+    assert len(board.get_legal_moves()) == 14
+
+
+def test_board_writes_update_bitboards():
+    board = Board()
+    sq = rules.square_index("e4")
+    board.state.board[sq] = 'N'
+    assert board.state.bb[rules.WN] >> sq & 1
+    assert board.state.occ_w >> sq & 1
+    board.state.board[sq] = None
+    assert not board.state.occ >> sq & 1
+
+
+def test_board_view_slices_and_compares_like_a_list():
+    board = Board()
+    squares = board.state.board
+    assert squares[0:8] == ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r']
+    assert squares[-8:] == ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
+    assert squares == list(squares)
+    assert squares == Board().state.board
+    squares[rules.square_index("e2")] = None
+    assert squares != Board().state.board
+
+
+def test_legal_moves_cached_until_board_changes():
+    board = Board()
+    board.get_legal_moves()
+    cached = rules.cached_legal_moves(board.state)
+    board.get_legal_moves()
+    assert rules.cached_legal_moves(board.state) is cached
+    board.state.board[rules.square_index("e2")] = None
+    assert rules.cached_legal_moves(board.state) is None
+    assert rules.Move.from_uci("e1e2") in board.get_legal_moves()
+
+
+def test_legal_moves_are_a_fresh_list():
+    board = Board()
+    moves = board.get_legal_moves()
+    assert isinstance(moves, list)
+    assert board.get_legal_moves() is not moves
+    last = moves.pop()
+    moves.clear()
+    assert len(board.get_legal_moves()) == 20
+    board.make_move(last)
+    assert board.state.to_move == rules.BLACK
+
+
+def test_move_cache_can_be_disabled():
+    board = Board(enable_move_cache=False)
+    moves = board.get_legal_moves()
+    assert board.get_legal_moves() is not moves
+    assert board.get_legal_moves() == moves
+    assert board.get_legal_moves_set() == frozenset(moves)
+    assert not board.is_checkmate()
+    assert not board.is_stalemate()
+    assert rules.cached_legal_moves(board.state) is None
+    assert board.state._legal_set_cache is None
+
+
+def test_legal_move_set_matches_list():
+    board = Board()
+    moves = board.get_legal_moves_set()
+    assert moves == frozenset(board.get_legal_moves())
+    assert board.get_legal_moves_set() is moves
+    assert rules.Move.from_uci("g1f3") in moves
+    board.make_move(rules.Move.from_uci("g1f3"))
+    assert rules.Move.from_uci("g8f6") in board.get_legal_moves_set()
+    board.undo_move()
+    assert board.get_legal_moves_set() is moves
+
+
+def test_make_move_checks_against_cached_moves():
+    board = Board()
+    assert rules.cached_legal_moves(board.state) is None
+    moves = board.get_legal_moves()
+    assert rules.cached_legal_moves(board.state) == tuple(moves)
+    with pytest.raises(ValueError):
+        board.make_move(rules.Move.from_uci("e2e5"))
+    board.make_move(rules.Move.from_uci("e2e4"))
+    assert rules.cached_legal_moves(board.state) is None
+
+
+def test_changing_returned_moves_keeps_rules_intact():
+    board = Board()
+    board.get_legal_moves().clear()
+    assert not board.is_stalemate()
+    assert not board.is_checkmate()
+    moves = board.get_legal_moves()
+    moves.remove(rules.Move.from_uci("g1h3"))
+    board.make_move(rules.Move.from_uci("g1h3"))
+
+
+def test_en_passant_capture_of_checking_pawn():
+    # d5 pawn just gave check; taking it en passant is the only pawn answer
+    board = Board("8/8/8/2k5/3Pp3/8/8/4K3 b - d3 0 1")
+    legal = board.get_legal_moves()
+    assert rules.Move.from_uci("e4d3") in legal
+    assert rules.Move.from_uci("e4e3") not in legal
+
+
+def test_en_passant_exposing_king_on_rank_is_illegal():
+    board = Board("8/8/8/K2pP2r/8/8/8/7k w - d6 0 1")
+    assert rules.Move.from_uci("e5d6") not in board.get_legal_moves()
+
+
+def test_king_cannot_retreat_along_checking_ray():
+    board = Board("4k3/8/8/8/4r3/8/4K3/8 w - - 0 1")
+    legal = board.get_legal_moves()
+    assert rules.Move.from_uci("e2d1") in legal
+    assert rules.Move.from_uci("e2e1") not in legal
+    assert len(legal) == 6
+
+
+def test_pinned_piece_moves_only_along_pin():
+    fen = "4k3/8/8/8/4r3/8/4R3/4K3 w - - 0 1"
+    board = Board(fen)
+    legal = board.get_legal_moves()
+    assert rules.Move.from_uci("e2e4") in legal
+    assert rules.Move.from_uci("e2e3") in legal
+    assert rules.Move.from_uci("e2d2") not in legal
+    assert rules.compute_pins(board.state, rules.WHITE) == 1 << rules.square_index("e2")
+
+
+def test_double_check_allows_only_king_moves():
+    fen = "4k3/8/8/8/8/5n2/3R4/r3K3 w - - 0 1"
+    board = Board(fen)
+    assert bin(rules.compute_checkers(board.state, rules.WHITE)).count('1') == 2
+    assert all(mv.from_sq == rules.square_index("e1") for mv in board.get_legal_moves())
+
+
+@pytest.mark.parametrize("fen, expected", [
+    ("8/8/8/8/8/8/8/K1k5 w - - 0 1", True),
+    ("8/8/8/8/8/8/8/KNk5 w - - 0 1", True),
+    ("8/8/8/8/8/8/8/KBk5 w - - 0 1", True),
+    ("8/8/8/8/8/8/8/KBkb4 w - - 0 1", True),    # bishops on the same colour
+    ("8/8/8/8/8/8/8/KBk1b3 w - - 0 1", False),  # bishops on opposite colours
+    ("8/8/8/8/8/8/8/KNkn4 w - - 0 1", False),
+    ("8/8/8/8/8/8/P7/K1k5 w - - 0 1", False),
+])
+def test_insufficient_material(fen, expected):
+    assert Board(fen).is_insufficient_material() is expected
+
+
+def test_is_legal_matches_generated_moves():
+    fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    state = rules.State.from_fen(fen)
+    legal = set(rules.generate_legal_moves(state))
+    for frm in range(64):
+        for to in range(64):
+            mv = rules.Move(frm, to)
+            assert rules.is_legal(state, mv) == (mv in legal)
+
+
+@pytest.mark.parametrize("fen", [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN w KQkq - 0 1",   # short rank
+    "rnbqkbnx/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",  # unknown piece
+])
+def test_from_fen_rejects_malformed_board(fen):
+    with pytest.raises(ValueError):
+        rules.State.from_fen(fen)
+
+
+def test_generated_moves_are_interned():
+    state = rules.State.from_fen("4k3/P7/8/8/8/8/8/4K2R w K - 0 1")
+    moves = rules.generate_pseudo_legal_moves(state)
+    e1, h1 = rules.square_index("e1"), rules.square_index("h1")
+    g1 = rules.square_index("g1")
+    assert any(mv is rules.MOVE_TABLE[e1][g1] for mv in moves)
+    assert any(mv is rules.MOVE_TABLE[h1][g1] for mv in moves)
+    promos = [mv for mv in moves if mv.promotion]
+    assert sorted(mv.promotion for mv in promos) == ['b', 'n', 'q', 'r']
+    assert rules.Move.from_uci("a7a8q") in promos
+
+
+def test_move_is_packed_int():
+    mv = rules.Move.from_uci("a7a8q")
+    a7, a8 = rules.square_index("a7"), rules.square_index("a8")
+    assert isinstance(mv, int)
+    assert mv == a7 | a8 << 6 | rules.QUEEN << 12
+    assert (mv.from_sq, mv.to_sq, mv.promotion) == (a7, a8, "q")
+    assert mv.to_uci() == "a7a8q"
+    assert {mv: 1}[rules.Move(a7, a8, "q")] == 1
+    with pytest.raises(ValueError):
+        rules.Move.from_uci("a7a8x")
+
+
+def test_move_survives_pickle_and_deepcopy():
+    mv = rules.Move.from_uci("a7a8q")
+    restored = pickle.loads(pickle.dumps(mv))
+    assert restored == mv and type(restored) is rules.Move
+    assert copy.deepcopy(mv).promotion == "q"
+
+
+@pytest.mark.parametrize("args", [(64, 0), (8, 64), (-1, 0), (8, 0, "x")])
+def test_move_rejects_invalid_input(args):
+    with pytest.raises(ValueError):
+        rules.Move(*args)
+
+
+def test_state_and_move_have_no_instance_dict():
+    state = rules.State.from_fen("4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+    assert not hasattr(state, "__dict__")
+    assert not hasattr(rules.Move.from_uci("e1e2"), "__dict__")
+
+
+def test_from_uci_returns_interned_moves():
+    e2, e4 = rules.square_index("e2"), rules.square_index("e4")
+    assert rules.Move.from_uci("e2e4") is rules.MOVE_TABLE[e2][e4]
+    assert rules.Move.from_uci("b7b8n") == rules.Move(
+        rules.square_index("b7"), rules.square_index("b8"), "n"
+    )
+    assert rules.Move.from_uci("b7b8N").promotion == "n"
+    assert rules.index_to_square(rules.square_index("h1")) == "h1"
+    with pytest.raises(ValueError):
+        rules.square_index("i9")
+
+
+@pytest.mark.parametrize("fen", [
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+])
+def test_attacked_squares_matches_square_test(fen):
+    state = rules.State.from_fen(fen)
+    for color in (rules.WHITE, rules.BLACK):
+        attacked = rules.attacked_squares(state, color, state.occ)
+        for sq in range(64):
+            assert bool(attacked >> sq & 1) == rules.is_sq_attacked_bb(state, sq, color)
+
+
+def test_set_wise_attacks_match_tables():
+    for sq in range(64):
+        bit = 1 << sq
+        assert rules.knight_attack_set(bit) == rules.KNIGHT_ATTACKS[sq]
+        assert rules.pawn_attack_set(bit, rules.WHITE) == rules.PAWN_ATTACKS_W[sq]
+        assert rules.pawn_attack_set(bit, rules.BLACK) == rules.PAWN_ATTACKS_B[sq]
+
+
+def test_slider_lookups_match_ray_scan():
+    rng = random.Random(7)
+    for sq in range(64):
+        for _ in range(20):
+            occ = rng.getrandbits(64) & rng.getrandbits(64)
+            diag = 0
+            for offset in rules.BISHOP_OFFSETS:
+                diag |= rules.ray_attacks(sq, occ, offset)
+            orth = 0
+            for offset in rules.ROOK_OFFSETS:
+                orth |= rules.ray_attacks(sq, occ, offset)
+            assert rules.bishop_attacks(sq, occ) == diag
+            assert rules.rook_attacks(sq, occ) == orth
+            assert rules.queen_attacks(sq, occ) == diag | orth
+
+
+def perft(state, depth):
+    moves = rules.generate_legal_moves(state, use_cache=False)
+    if depth == 1:
+        return len(moves)
+    total = 0
+    for mv in moves:
+        undo = rules.apply_move_inplace(state, mv)
+        total += perft(state, depth - 1)
+        rules.undo_move_inplace(state, mv, undo)
+    return total
+
+
+@pytest.mark.parametrize("fen, depth, expected", [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 3, 8902),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 2, 2039),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 3, 2812),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 9467),
+])
+def test_perft_counts(fen, depth, expected):
+    assert perft(rules.State.from_fen(fen), depth) == expected
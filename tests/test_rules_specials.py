@@ -2,7 +2,7 @@ import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import pytest
-from chessgpt import Board, rules
+from chessgpt import rules
 
 # Helper to play a sequence of moves on the board
 def play(board, moves):
@@ -15,8 +15,8 @@ def play(board, moves):
     ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "e1c1"),
     ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "e8g8"),
 ])
-def test_castling_legal(fen, move):
-    board = Board(fen)
+def test_castling_legal(board_factory, fen, move):
+    board = board_factory(fen)
     mv = rules.Move.from_uci(move)
     assert mv in board.get_legal_moves()
 
@@ -26,8 +26,8 @@ def test_castling_legal(fen, move):
     ("r3k2r/8/8/8/8/8/8/R3KN1R w KQkq - 0 1", "e1g1"),  # piece blocking
     ("r3k2r/8/8/8/8/8/8/R3K2R w Q - 0 1", "e1g1"),      # rights missing
 ])
-def test_castling_illegal(fen, move):
-    board = Board(fen)
+def test_castling_illegal(board_factory, fen, move):
+    board = board_factory(fen)
     mv = rules.Move.from_uci(move)
     assert mv not in board.get_legal_moves()
 
@@ -37,8 +37,8 @@ def test_castling_illegal(fen, move):
     (['d2d4', 'a7a6', 'd4d5', 'e7e5'], 'd5e6'),
     (['c2c4', 'a7a6', 'c4c5', 'd7d5'], 'c5d6'),
 ])
-def test_en_passant_legal(sequence, capture):
-    board = Board()
+def test_en_passant_legal(board_factory, sequence, capture):
+    board = board_factory()
     play(board, sequence)
     mv = rules.Move.from_uci(capture)
     assert mv in board.get_legal_moves()
@@ -49,8 +49,8 @@ def test_en_passant_legal(sequence, capture):
     (['e2e4', 'a7a6', 'e4e5', 'h7h6'], 'e5d6'),
     (['e2e4', 'a7a6', 'e4e5', 'd7d6', 'a2a3'], 'e5d6'),
 ])
-def test_en_passant_illegal(sequence, capture):
-    board = Board()
+def test_en_passant_illegal(board_factory, sequence, capture):
+    board = board_factory()
     play(board, sequence)
     mv = rules.Move.from_uci(capture)
     assert mv not in board.get_legal_moves()
@@ -61,12 +61,15 @@ def test_en_passant_illegal(sequence, capture):
     ("7k/8/8/8/8/8/p6P/7K b - - 0 1", "a2a1n", 'n'),
     ("8/1P6/8/8/8/8/7p/7K w - - 0 1", "b7b8r", 'R'),
 ])
-def test_promotion_legal(fen, move, piece):
-    board = Board(fen)
+def test_promotion_legal(board_factory, fen, move, piece):
+    board = board_factory(fen)
     mv = rules.Move.from_uci(move)
     assert mv in board.get_legal_moves()
     board.make_move(mv)
-    assert board.state.board[rules.square_index(move[2:4])] == piece
+    sq = rules.square_index(move[2:4])
+    assert board.state.board[sq] == piece
+    # the mailbox is only a view: the bitboards hold the promoted piece
+    assert board.state.bb[rules.PIECE_CODES[piece]] == 1 << sq
 
 
 @pytest.mark.parametrize("fen, move", [
@@ -74,8 +77,8 @@ def test_promotion_legal(fen, move, piece):
     ("8/P7/8/8/8/8/7p/7K w - - 0 1", "a7a8k"),        # invalid piece
     ("8/8/8/R7/8/8/8/7K w - - 0 1", "a4a8q"),        # rook promotion attempt
 ])
-def test_promotion_illegal(fen, move):
-    board = Board(fen)
+def test_promotion_illegal(board_factory, fen, move):
+    board = board_factory(fen)
     mv = rules.Move.from_uci(move)
     assert mv not in board.get_legal_moves()
 
@@ -85,8 +88,8 @@ def test_promotion_illegal(fen, move):
     (99, False),
     (100, True),
 ])
-def test_fifty_move_rule_detection(halfmove, expected):
+def test_fifty_move_rule_detection(board_factory, halfmove, expected):
     fen = f"8/8/8/8/8/8/8/K1k5 w - - {halfmove} 1"
-    board = Board(fen)
+    board = board_factory(fen)
     assert board.is_draw_by_fifty_moves() is expected
 
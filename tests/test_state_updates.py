@@ -1,6 +1,8 @@
 import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import pytest
+
 from chessgpt import Board, rules
 
 
@@ -39,8 +41,8 @@ def test_king_move_removes_castling_rights():
     fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
     board = Board(fen)
     board.make_move(rules.Move.from_uci("e1e2"))
-    assert "K" not in board.state.castling_rights
-    assert "Q" not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_WK
+    assert not board.state.castling_rights & rules.CR_WQ
 
 
 
@@ -48,28 +50,28 @@ def test_rook_move_removes_castling_rights():
     fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
     board = Board(fen)
     board.make_move(rules.Move.from_uci("a1a2"))
-    assert "Q" not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_WQ
 
 
 def test_rook_move_removes_kingside_rights():
     fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
     board = Board(fen)
     board.make_move(rules.Move.from_uci("h1h2"))
-    assert "K" not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_WK
 
 
 def test_capture_rook_removes_castling_rights():
     fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
     board = Board(fen)
     board.make_move(rules.Move.from_uci("a1a8"))  # capture rook on a8
-    assert "q" not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_BQ
 
 
 def test_capture_rook_removes_black_kingside_rights():
     fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
     board = Board(fen)
     board.make_move(rules.Move.from_uci("h1h8"))  # capture rook on h8
-    assert "k" not in board.state.castling_rights
+    assert not board.state.castling_rights & rules.CR_BK
 
 
 def test_to_move_switches_after_move():
@@ -78,3 +80,143 @@ def test_to_move_switches_after_move():
     board.make_move(rules.Move.from_uci("e2e4"))
     assert board.state.to_move != current
 
+
+def test_to_move_is_a_colour_index():
+    board = Board()
+    assert board.state.to_move == rules.WHITE
+    board.make_move(rules.Move.from_uci("e2e4"))
+    assert board.state.to_move == rules.BLACK
+    assert board.state.to_move == rules.opposite(rules.WHITE)
+    board.undo_move()
+    assert board.state.to_move == rules.WHITE
+
+
+
+def test_castling_rights_bits_after_moves():
+    fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+    board = Board(fen)
+    assert board.state.castling_rights == rules.CR_WK | rules.CR_WQ | rules.CR_BK | rules.CR_BQ
+    board.make_move(rules.Move.from_uci("e1e2"))
+    board.make_move(rules.Move.from_uci("h8h1"))
+    assert board.state.castling_rights == rules.CR_BQ
+
+
+def test_castle_mask_only_touches_home_squares():
+    all_rights = rules.CR_WK | rules.CR_WQ | rules.CR_BK | rules.CR_BQ
+    cleared = {
+        rules.index_to_square(sq): all_rights & ~mask
+        for sq, mask in enumerate(rules.CASTLE_MASK) if mask != all_rights
+    }
+    assert cleared == {
+        'a1': rules.CR_WQ, 'e1': rules.CR_WK | rules.CR_WQ, 'h1': rules.CR_WK,
+        'a8': rules.CR_BQ, 'e8': rules.CR_BK | rules.CR_BQ, 'h8': rules.CR_BK,
+    }
+
+
+def test_zobrist_key_matches_transposition():
+    a = Board()
+    for uci in ("g1f3", "g8f6", "b1c3"):
+        a.make_move(rules.Move.from_uci(uci))
+    b = Board()
+    for uci in ("b1c3", "g8f6", "g1f3"):
+        b.make_move(rules.Move.from_uci(uci))
+    assert a.state.key == b.state.key
+    assert a.state.key == rules.zobrist_key(a.state)
+    assert a.state.key != Board().state.key
+
+
+def test_zobrist_key_includes_capturable_en_passant():
+    board = Board()
+    for uci in ("e2e4", "d7d5", "e4e5", "f7f5"):
+        board.make_move(rules.Move.from_uci(uci))
+    fen = "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"
+    assert board.state.key == rules.State.from_fen(fen).key
+    assert board.state.key != rules.State.from_fen(fen.replace(" f6 ", " - ")).key
+    state = board.state
+    state.board[rules.square_index("e5")] = None  # nothing can take on f6 now
+    assert state.key == rules.zobrist_key(state)
+    assert state.key == rules.State.from_fen(fen.replace("3pPp2", "3p1p2")).key
+
+
+def test_zobrist_key_ignores_uncapturable_en_passant():
+    board = Board()
+    board.make_move(rules.Move.from_uci("e2e4"))
+    fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+    assert board.state.key == rules.State.from_fen(fen).key
+    assert board.state.key == rules.State.from_fen(fen.replace(" e3 ", " - ")).key
+    assert board.state.key == rules.zobrist_key(board.state)
+
+
+def test_state_constructor_takes_public_field_names():
+    fen = "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"
+    parsed = rules.State.from_fen(fen)
+    state = rules.State(
+        squares=parsed.squares[:],
+        to_move=rules.WHITE,
+        castling_rights=parsed.castling_rights,
+        en_passant=rules.square_index("f6"),
+        halfmove_clock=0,
+        fullmove_number=3,
+    )
+    assert state == parsed
+    assert state.key == parsed.key
+    assert state.clone() == state
+
+
+def test_assigning_hashed_fields_updates_key():
+    board = Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    state = board.state
+    assert rules.Move.from_uci("e1g1") in board.get_legal_moves()
+    state.castling_rights = 0
+    assert state.key == rules.zobrist_key(state)
+    assert rules.Move.from_uci("e1g1") not in board.get_legal_moves()
+    with pytest.raises(ValueError):
+        board.make_move(rules.Move.from_uci("e1g1"))
+    state.to_move = rules.BLACK
+    assert state.key == rules.zobrist_key(state)
+    assert all(mv.from_sq < 8 for mv in board.get_legal_moves())
+    state.en_passant = rules.square_index("d3")
+    assert state.key == rules.zobrist_key(state)
+    state.en_passant = None
+    assert state.key == rules.State.from_fen("r3k2r/8/8/8/8/8/8/R3K2R b - - 0 1").key
+
+
+@pytest.mark.parametrize("fen", [
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+])
+def test_incremental_key_matches_full_hash(fen):
+    state = rules.State.from_fen(fen)
+    start = state.key
+    for mv in rules.generate_legal_moves(state):
+        undo = rules.apply_move_inplace(state, mv)
+        assert state.key == rules.zobrist_key(state), mv.to_uci()
+        rules.undo_move_inplace(state, mv, undo)
+        assert state.key == start
+
+
+def test_ep_target_only_for_double_pushes():
+    e2, e3, e4 = (rules.square_index(s) for s in ("e2", "e3", "e4"))
+    d7, d6, d5 = (rules.square_index(s) for s in ("d7", "d6", "d5"))
+    assert rules.EP_TARGET[e2 | e4 << 6] == e3
+    assert rules.EP_TARGET[d7 | d5 << 6] == d6
+    assert rules.EP_TARGET[e2 | e3 << 6] is None
+    assert rules.EP_TARGET[e3 | rules.square_index("e5") << 6] is None
+
+
+@pytest.mark.parametrize("to_move, uci, remaining", [
+    ("w", "a1a8", "Kk"),  # leaves a1 and captures on a8
+    ("w", "h1h8", "Qq"),
+    ("w", "e1d1", "kq"),
+    ("b", "a8a1", "Kk"),
+    ("b", "h8h1", "Qq"),
+    ("b", "e8f8", "KQ"),
+])
+def test_castle_mask_clears_rights_for_both_endpoints(to_move, uci, remaining):
+    board = Board(f"r3k2r/8/8/8/8/8/8/R3K2R {to_move} KQkq - 0 1")
+    board.make_move(rules.Move.from_uci(uci))
+    expected = 0
+    for ch in remaining:
+        expected |= rules.CASTLING_BITS[ch]
+    assert board.state.castling_rights == expected